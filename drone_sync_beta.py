@@ -1,72 +1,109 @@
 import DaVinciResolveScript as dvr
 import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import os
 import re
-from datetime import datetime
-
-
-def _read_text(path: Path):
-    encodings = ['utf-8', 'utf-8-sig', 'gb18030', 'latin-1']
-    for enc in encodings:
-        try:
-            with path.open('r', encoding=enc) as f:
-                return f.read()
-        except Exception:
-            continue
-    with path.open('r', errors='ignore') as f:
-        return f.read()
-
-
-def parse_srt_for_timestamp(srt_path: Path):
-    content = _read_text(srt_path)
-    m = re.search(r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})", content)
-    if not m:
-        return None
-    return datetime.strptime(m.group(1), "%Y-%m-%d %H:%M:%S.%f")
-
-
-def get_clip_duration_frames(srt_path: Path, fps: int):
-    content = _read_text(srt_path)
-    diff_times = re.findall(r"DiffTime: (\d+)ms", content)
-    if diff_times:
-        total_ms = sum(int(x) for x in diff_times)
-        frame_ms = 1000.0 / fps
-        return int(total_ms / frame_ms)
-    entries = re.findall(r"FrameCnt: (\d+)", content)
-    if entries:
-        return len(entries)
-    return None
-
-
-def compute_record_frame(ts: datetime, fps: int):
-    day_start = ts.replace(hour=0, minute=0, second=0, microsecond=0)
-    delta = ts - day_start
-    return int(round(delta.total_seconds() * fps))
+import unicodedata
+
+try:
+    import re2 as _srt_re
+except ImportError:
+    _srt_re = re
+
+_TS_RE = _srt_re.compile(rb"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})")
+_DIFFTIME_RE = _srt_re.compile(rb"DiffTime: (\d+)ms")
+_FRAMECNT_RE = _srt_re.compile(rb"FrameCnt: (\d+)")
+_RES_RE = re.compile(r"(\d{3,5})x(\d{3,5})")
+_SPLIT_RE = re.compile(r"[，,\s]+")
+_SAFE_RE = re.compile(r"[\\/:*?\"<>|]")
+
+_SRT_HEAD_BYTES = 4096
+_SRT_CHUNK_BYTES = 1 << 20
+_SRT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+_subfolder_cache = {}
+
+
+def _srt_blocks(f):
+    # Yield whole lines only, so no match is split across two blocks
+    tail = b''
+    size = _SRT_HEAD_BYTES
+    while True:
+        chunk = f.read(size)
+        size = _SRT_CHUNK_BYTES
+        if not chunk:
+            if tail:
+                yield tail
+            return
+        buf = tail + chunk
+        cut = buf.rfind(b'\n') + 1
+        if cut:
+            yield buf[:cut]
+        tail = buf[cut:]
+
+
+def _parse_dji_ts(b: bytes):
+    # Fixed layout: YYYY-MM-DD HH:MM:SS.mmm
+    day = (int(b[0:4]), int(b[5:7]), int(b[8:10]))
+    us = (int(b[11:13]) * 3600 + int(b[14:16]) * 60 + int(b[17:19])) * 1_000_000 + int(b[20:23]) * 1000
+    return day, us
+
+
+def parse_srt(srt_path: str, fps: int):
+    ts = None
+    total_ms = None
+    frame_cnt = 0
+    with open(srt_path, 'rb') as f:
+        for block in _srt_blocks(f):
+            if ts is None:
+                m = _TS_RE.search(block)
+                if m:
+                    ts = _parse_dji_ts(m.group(1))
+            diff_times = _DIFFTIME_RE.findall(block)
+            if diff_times:
+                total_ms = (total_ms or 0) + sum(map(int, diff_times))
+            elif total_ms is None:
+                frame_cnt += len(_FRAMECNT_RE.findall(block))
+    if ts is None:
+        return None, None
+    if total_ms is not None:
+        return ts, total_ms * fps // 1000
+    if frame_cnt:
+        return ts, frame_cnt
+    return ts, None
+
+
+def compute_record_frame(us: int, fps: int):
+    return (us * fps + 500_000) // 1_000_000
 
 
 def list_cam_folders(date_folder: Path):
     cams = []
-    for p in sorted(date_folder.iterdir()):
-        if p.is_dir() and p.name.upper().startswith("CAM"):
-            cams.append(p)
+    with os.scandir(date_folder) as it:
+        for e in it:
+            if e.name[:3].upper() == "CAM" and e.is_dir():
+                cams.append(Path(e.path))
+    cams.sort(key=lambda p: p.name)
     return cams
 
 
 def _select_indices(count: int, prompt: str):
     sel = input(prompt).strip()
     result = []
+    seen = set()
     if sel:
-        for token in re.split(r"[，,\s]+", sel):
+        for token in _SPLIT_RE.split(sel):
             if not token:
                 continue
             try:
                 i = int(token)
-                if 1 <= i <= count:
-                    if i not in result:
-                        result.append(i)
-            except Exception:
+            except ValueError:
                 continue
+            if 1 <= i <= count and i not in seen:
+                seen.add(i)
+                result.append(i)
     return result
 
 
@@ -79,41 +116,53 @@ def norm_ext(name: str):
     return ''
 
 
-def find_srt_for_video(video_path: Path):
-    base = video_path.with_suffix('')
-    candidate_lower = base.with_suffix('.srt')
-    candidate_upper = base.with_suffix('.SRT')
-    if candidate_lower.exists():
-        if not candidate_lower.name.startswith('._') and not candidate_lower.name.startswith('.'):
-            return candidate_lower
-    if candidate_upper.exists():
-        if not candidate_upper.name.startswith('._') and not candidate_upper.name.startswith('.'):
-            return candidate_upper
-    for srt in video_path.parent.glob('*.srt'):
-        if srt.stem == video_path.stem:
-            if not srt.name.startswith('._') and not srt.name.startswith('.'):
-                return srt
-    for srt in video_path.parent.glob('*.SRT'):
-        if srt.stem == video_path.stem:
-            if not srt.name.startswith('._') and not srt.name.startswith('.'):
-                return srt
-    return None
+def _scandir_files(root: Path):
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if e.name.startswith('.'):
+                    continue
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.is_file():
+                        yield e
+                except OSError:
+                    continue
 
 
 def scan_videos(cam_folder: Path):
     videos = []
-    for p in cam_folder.rglob('*'):
-        if p.name.startswith('._') or p.name.startswith('.'):
+    srt_by_dir = {}
+    for e in _scandir_files(cam_folder):
+        kind = norm_ext(e.name)
+        if not kind:
             continue
-        if p.is_file() and norm_ext(p.name) == 'video':
-            videos.append(p)
-    return videos
-
-
-def ensure_bin(media_pool, root_folder, name: str):
-    if root_folder is None:
-        return None
-    subs = None
+        stem, ext = os.path.splitext(e.name)
+        stem = stem.lower()
+        d = os.path.dirname(e.path)
+        if kind == 'video':
+            videos.append((e.path, stem, d))
+        else:
+            srts = srt_by_dir.setdefault(d, {})
+            if ext == '.srt':
+                srts[stem] = e.path
+            else:
+                srts.setdefault(stem, e.path)
+    return videos, srt_by_dir
+
+
+def _subfolders_by_name(root_folder):
+    cached = _subfolder_cache.get(id(root_folder))
+    if cached is not None:
+        return cached[1]
+    by_name = {}
     try:
         subs = root_folder.GetSubFolders()
     except Exception:
@@ -121,43 +170,83 @@ def ensure_bin(media_pool, root_folder, name: str):
     if isinstance(subs, dict):
         for f in subs.values():
             try:
-                if f.GetName() == name:
-                    return f
+                by_name.setdefault(f.GetName(), f)
             except Exception:
                 continue
+    # Hold a reference to the parent so its id() cannot be reused
+    _subfolder_cache[id(root_folder)] = (root_folder, by_name)
+    return by_name
+
+
+def ensure_bin(media_pool, root_folder, name: str):
+    if root_folder is None:
+        return None
+    by_name = _subfolders_by_name(root_folder)
+    if name in by_name:
+        return by_name[name]
     try:
         media_pool.SetCurrentFolder(root_folder)
     except Exception:
         pass
     created = media_pool.AddSubFolder(root_folder, name)
     if created:
+        by_name[name] = created
         return created
     # Fallback: re-scan
-    try:
-        subs = root_folder.GetSubFolders()
-        if isinstance(subs, dict):
-            for f in subs.values():
-                try:
-                    if f.GetName() == name:
-                        return f
-                except Exception:
-                    continue
-    except Exception:
-        pass
-    return None
+    _subfolder_cache.pop(id(root_folder), None)
+    return _subfolders_by_name(root_folder).get(name)
 
 
-def get_or_create_timeline(project, media_pool, name: str):
+def list_timelines(project):
+    existing = {}
     cnt = project.GetTimelineCount()
     for i in range(1, cnt + 1):
         tl = project.GetTimelineByIndex(i)
-        if tl and tl.GetName() == name:
-            return tl
-    return media_pool.CreateEmptyTimeline(name)
+        if tl:
+            existing.setdefault(tl.GetName(), tl)
+    return existing
+
+
+def get_or_create_timeline(existing, media_pool, name: str):
+    if name in existing:
+        return existing[name]
+    tl = media_pool.CreateEmptyTimeline(name)
+    if tl:
+        existing[name] = tl
+    return tl
+
+
+def _clip_props(item):
+    try:
+        props = item.GetClipProperty()
+    except Exception:
+        return {}
+    return props if isinstance(props, dict) else {}
+
+
+def _path_key(path: str):
+    return unicodedata.normalize('NFC', os.path.normcase(os.path.normpath(path)))
+
+
+def _parse_resolution(res):
+    if not isinstance(res, str):
+        return None
+    m = _RES_RE.search(res)
+    if not m:
+        return None
+    return int(m.group(1)), int(m.group(2))
+
+
+def max_resolution(resolutions):
+    max_w, max_h = 0, 0
+    for r in resolutions:
+        if r and r[0] * r[1] > max_w * max_h:
+            max_w, max_h = r
+    return max_w, max_h
 
 
 def safe_filename(name: str) -> str:
-    return re.sub(r"[\\/:*?\"<>|]", "_", name)
+    return _SAFE_RE.sub("_", name)
 
 
 def main():
@@ -215,6 +304,7 @@ def main():
     media_pool = project.GetMediaPool()
     root = media_pool.GetRootFolder()
     project.SetSetting('timelineFrameRate', str(fps))
+    existing_timelines = list_timelines(project)
 
     all_timelines = []
     for cam_folder in chosen_cams:
@@ -223,61 +313,55 @@ def main():
         if cam_bin is None:
             print(f'创建或获取机位文件夹失败: {cam_id}')
             continue
-        videos = scan_videos(cam_folder)
-        group_by_date = {}
-        for v in videos:
-            srt = find_srt_for_video(v)
+        videos, srt_by_dir = scan_videos(cam_folder)
+        pending = []
+        for v, stem, d in videos:
+            srt = srt_by_dir.get(d, {}).get(stem)
             if not srt:
                 print(f'跳过无SRT的素材: {v}')
                 continue
-            ts = parse_srt_for_timestamp(srt)
+            pending.append((v, srt))
+        with ThreadPoolExecutor(max_workers=_SRT_WORKERS) as ex:
+            parsed = list(ex.map(lambda p: parse_srt(p[1], fps), pending))
+        group_by_date = defaultdict(list)
+        for (v, _), (ts, duration) in zip(pending, parsed):
             if not ts:
                 print(f'跳过无法解析时间戳的素材: {v}')
                 continue
-            realdate = ts.strftime('%y-%m-%d')
-            group_by_date.setdefault(realdate, []).append((v, srt, ts))
+            day, us = ts
+            group_by_date[day].append((v, us, duration))
 
-        for realdate, items in sorted(group_by_date.items()):
+        for (y, mo, day), items in sorted(group_by_date.items()):
+            realdate = f'{y % 100:02d}-{mo:02d}-{day:02d}'
             date_bin = ensure_bin(media_pool, cam_bin, realdate)
             media_pool.SetCurrentFolder(date_bin)
             if date_bin is None:
                 print(f'创建或获取日期文件夹失败: {cam_id}/{realdate}')
                 continue
             imported_items = []
-            for v, srt, ts in items:
-                added = media_pool.ImportMedia([str(v)])
-                if added:
-                    imported_items.append((added[0], v, srt, ts))
+            added = media_pool.ImportMedia([v for v, _, _ in items]) or []
+            # ImportMedia does not guarantee input order, so pair by file path
+            by_path = {_path_key(v): (v, us, duration) for v, us, duration in items}
+            for item in added:
+                props = _clip_props(item)
+                key = props.get('File Path')
+                entry = by_path.pop(_path_key(key), None) if isinstance(key, str) else None
+                if entry:
+                    res = _parse_resolution(props.get('Resolution'))
+                    imported_items.append((item,) + entry + (res,))
+            for v, _, _ in by_path.values():
+                print(f'导入失败: {v}')
             timeline_name = f"{date_folder.name}_{cam_id}_{realdate}"
-            timeline = get_or_create_timeline(project, media_pool, timeline_name)
+            timeline = get_or_create_timeline(existing_timelines, media_pool, timeline_name)
             if not timeline:
                 print(f'创建时间线失败: {timeline_name}')
                 continue
             timeline.SetSetting('timelineFrameRate', str(fps))
             timeline.SetStartTimecode('00:00:00:00')
-            max_w, max_h = 0, 0
+            max_w, max_h = max_resolution([res for _, _, _, _, res in imported_items])
             clip_infos = []
-            for item, v, srt, ts in imported_items:
-                try:
-                    res = item.GetClipProperty('Resolution')
-                    if isinstance(res, str):
-                        m = re.search(r"(\d{3,5})x(\d{3,5})", res)
-                        if m:
-                            w, h = int(m.group(1)), int(m.group(2))
-                            if w * h > max_w * max_h:
-                                max_w, max_h = w, h
-                    elif isinstance(res, dict):
-                        val = res.get('Resolution')
-                        if isinstance(val, str):
-                            m = re.search(r"(\d{3,5})x(\d{3,5})", val)
-                            if m:
-                                w, h = int(m.group(1)), int(m.group(2))
-                                if w * h > max_w * max_h:
-                                    max_w, max_h = w, h
-                except Exception:
-                    pass
-                record_frame = compute_record_frame(ts, fps)
-                duration = get_clip_duration_frames(srt, fps)
+            for item, v, us, duration, _ in imported_items:
+                record_frame = compute_record_frame(us, fps)
                 info = {
                     'mediaPoolItem': item,
                     'trackIndex': 1,
@@ -295,10 +379,14 @@ def main():
                 rh = timeline.GetSetting('timelineResolutionHeight')
                 print(f"Timeline '{timeline_name}' 分辨率: {rw}x{rh}")
             clip_infos.sort(key=lambda x: x['recordFrame'])
-            for info in clip_infos:
-                ok = media_pool.AppendToTimeline([info])
-                if not ok:
-                    print(f"追加失败: {info['mediaPoolItem'].GetName()} @ {info['recordFrame']}")
+            appended = media_pool.AppendToTimeline(clip_infos) if clip_infos else []
+            if clip_infos and not appended:
+                for info in clip_infos:
+                    ok = media_pool.AppendToTimeline([info])
+                    if not ok:
+                        print(f"追加失败: {info['mediaPoolItem'].GetName()} @ {info['recordFrame']}")
+            elif isinstance(appended, list) and len(appended) < len(clip_infos):
+                print(f"追加失败: {len(clip_infos) - len(appended)} 个素材未能追加到 '{timeline_name}'")
             all_timelines.append(timeline)
 
     for tl in all_timelines: